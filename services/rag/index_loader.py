@@ -1,23 +1,30 @@
 """
-Load RAG index from MinIO (FAISS index and metadata).
+Load RAG index from MinIO (FAISS index and metadata), optionally through a
+local per-build cache with a memory-mapped FAISS index.
 """
 
 import os
+import fcntl
 import json
-import tempfile
 import pickle
 import asyncio
 import shutil
 from pathlib import Path
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 import faiss
+import numpy as np
 from minio import Minio
 
 
 class RAGIndexLoader:
     """
     Loads FAISS index and metadata from MinIO.
-    Uses temp files for FAISS compatibility (FAISS prefers file paths).
+
+    Without a cache directory, artifacts are read into memory and deserialized
+    directly from bytes. With a cache directory, artifacts are kept on local
+    disk per build_id and the FAISS index is memory-mapped (IO_FLAG_MMAP_IFC),
+    so restarts with an unchanged build skip the download and the vector data
+    stays in the OS page cache instead of being copied onto the heap.
     """
 
     def __init__(
@@ -28,6 +35,7 @@ class RAGIndexLoader:
         minio_secret_key: str = None,
         bucket_name: str = "rag-index",
         model_name: str = "nomic-ai/nomic-embed-text-v1.5",
+        cache_dir: Optional[str] = None,
     ):
         """
         Initialize the index loader.
@@ -39,6 +47,8 @@ class RAGIndexLoader:
             minio_secret_key: MinIO secret key (from env if not provided)
             bucket_name: MinIO bucket name (default: "rag-index")
             model_name: Name of the embedding model (for validation)
+            cache_dir: Local directory for cached artifacts
+                (from RAG_INDEX_CACHE_DIR if not provided; caching is off if unset)
         """
         # Get MinIO config from environment
         endpoint = minio_endpoint or os.getenv("MINIO_ENDPOINT")
@@ -62,9 +72,13 @@ class RAGIndexLoader:
         self.model_name = model_name
         self.embedding_dim = 768  # nomic-embed-text-v1.5 dimension
 
+        cache_dir = cache_dir or os.getenv("RAG_INDEX_CACHE_DIR")
+        self.cache_dir: Optional[Path] = Path(cache_dir) if cache_dir else None
+
         self.index: Optional[faiss.Index] = None
         self.error_store: Dict[str, Dict[str, Any]] = {}
-        self.index_to_error_id: Dict[int, str] = {}
+        self.index_to_error_id: List[str] = []
+        self._reset_result_columns()
         self._loaded = False
         self.last_loaded_build_id: Optional[str] = None
 
@@ -85,12 +99,14 @@ class RAGIndexLoader:
         except Exception:
             return False
 
-    def _load_index_sync(
-        self,
-    ) -> Tuple[faiss.Index, Dict[str, Dict[str, Any]], Dict[int, str]]:
+    def _load_index_sync(self) -> Dict[str, Any]:
         """
         Synchronous implementation of load_index.
         This method contains all the blocking I/O operations.
+
+        It only reads the new index and returns the loader attributes to set;
+        load_index swaps them in, so a reload keeps serving the current index
+        until the new one has fully loaded.
         """
         print("Loading RAG index from MinIO...")
 
@@ -103,10 +119,9 @@ class RAGIndexLoader:
 
         # Check status from LATEST.json
         try:
-            response = self.minio_client.get_object(self.bucket_name, "LATEST.json")
-            pointer = json.loads(response.read().decode())
+            pointer = json.loads(self._read_object("LATEST.json").decode())
             status = pointer.get("status")
-            self.last_loaded_build_id = pointer.get("build_id")
+            build_id = pointer.get("build_id")
 
             if status == "FAILED":
                 error_msg = pointer.get("error_message", "Unknown error")
@@ -138,84 +153,211 @@ class RAGIndexLoader:
                 "Run init job first to create the index."
             )
 
-        # Create temp directory for artifacts
-        temp_dir = Path(tempfile.mkdtemp(prefix="rag-index-"))
+        if self.cache_dir is not None and build_id:
+            index, metadata = self._load_artifacts_cached(build_id)
+        else:
+            index, metadata = self._load_artifacts_in_memory()
+        print(f"Loaded FAISS index with {index.ntotal} vectors")
+
+        error_store = metadata["error_store"]
+        index_to_error_id = metadata["index_to_error_id"]
+        if isinstance(index_to_error_id, dict):
+            # Indexes built before the list layout store a {position: error_id} dict
+            index_to_error_id = [
+                index_to_error_id[i] for i in range(len(index_to_error_id))
+            ]
+
+        # Validate model name from metadata
+        if "model_name" in metadata:
+            model_name_meta = metadata["model_name"]
+            if model_name_meta != self.model_name:
+                print(
+                    f"Warning: Model mismatch in metadata. "
+                    f"Metadata has {model_name_meta}, expected {self.model_name}"
+                )
+
+        print("✓ RAG index loaded successfully")
+        print(f"  Total errors: {len(error_store)}")
+        print(f"  Model: {metadata.get('model_name', 'unknown')}")
+
+        return {
+            "index": index,
+            "error_store": error_store,
+            "index_to_error_id": index_to_error_id,
+            "last_loaded_build_id": build_id,
+            **self._result_columns(error_store, index_to_error_id),
+        }
+
+    def _reset_result_columns(self):
+        """Clear the per-position result columns."""
+        self.error_ids: List[str] = []
+        self.error_titles: List[str] = []
+        self.source_files: List[Optional[str]] = []
+        self.pages: List[Optional[int]] = []
+        self.sections: List[Dict[str, Any]] = []
+
+    @staticmethod
+    def _result_columns(
+        error_store: Dict[str, Dict[str, Any]], index_to_error_id: List[str]
+    ) -> Dict[str, List[Any]]:
+        """
+        Lay out result fields as parallel lists indexed by FAISS position.
 
+        Query-time result assembly then reads each field with one list index
+        instead of going through index_to_error_id and the nested error_store
+        dicts for every hit.
+        """
+        records = [error_store[error_id] for error_id in index_to_error_id]
+        metadatas = [record.get("metadata", {}) for record in records]
+
+        return {
+            "error_ids": index_to_error_id,
+            "error_titles": [
+                record.get("error_title", error_id)
+                for record, error_id in zip(records, index_to_error_id)
+            ],
+            "source_files": [metadata.get("source_file") for metadata in metadatas],
+            "pages": [metadata.get("page") for metadata in metadatas],
+            "sections": [record.get("sections", {}) for record in records],
+        }
+
+    def _load_artifacts_in_memory(self) -> Tuple[faiss.Index, Dict[str, Any]]:
+        """Download both artifacts into memory and deserialize them."""
+        # Deserialize the FAISS index straight from the raw bytes
+        # (no temp-file round trip through the local disk)
         try:
-            index_path = temp_dir / "index.faiss"
-            metadata_path = temp_dir / "metadata.pkl"
+            index_bytes = self._read_object("index.faiss")
+            print(f"Downloaded FAISS index ({len(index_bytes)} bytes)")
+        except Exception as e:
+            raise ValueError(
+                f"Could not download index.faiss from MinIO: {e}. "
+                "Run init job first to create the index."
+            )
 
-            # Download FAISS index to temp file
-            try:
-                self.minio_client.fget_object(
-                    self.bucket_name, "index.faiss", str(index_path)
-                )
-                print("Downloaded FAISS index to temp file")
-            except Exception as e:
-                raise ValueError(
-                    f"Could not download index.faiss from MinIO: {e}. "
-                    "Run init job first to create the index."
-                )
+        try:
+            index = faiss.deserialize_index(np.frombuffer(index_bytes, dtype=np.uint8))
+        except Exception as e:
+            raise ValueError(f"Could not load FAISS index: {e}")
+        finally:
+            del index_bytes
 
-            # Load FAISS index from file (FAISS prefers file paths)
-            try:
-                self.index = faiss.read_index(str(index_path))
-                print(f"Loaded FAISS index with {self.index.ntotal} vectors")
-            except Exception as e:
-                raise ValueError(f"Could not load FAISS index: {e}")
+        try:
+            metadata_bytes = self._read_object("metadata.pkl")
+            print("Downloaded metadata")
+        except Exception as e:
+            raise ValueError(
+                f"Could not download metadata.pkl from MinIO: {e}. "
+                "Run init job first to create the index."
+            )
+
+        try:
+            metadata = pickle.loads(metadata_bytes)
+        except Exception as e:
+            raise ValueError(f"Could not load metadata: {e}")
+
+        return index, metadata
+
+    def _load_artifacts_cached(
+        self, build_id: str
+    ) -> Tuple[faiss.Index, Dict[str, Any]]:
+        """
+        Load artifacts from the local cache, downloading them on a cache miss.
+
+        The FAISS index is memory-mapped read-only: flat vectors and SQ codes
+        are used in place from the mapped file (only structures such as the
+        HNSW graph are copied onto the heap). The file is prefetched so the
+        first queries don't pay for page faults.
+        """
+        build_dir = self.cache_dir / build_id
+        index_path = build_dir / "index.faiss"
+        metadata_path = build_dir / "metadata.pkl"
+
+        # Workers sharing the cache coordinate through a lock file: readers
+        # hold it shared until the files are opened, while downloading and
+        # pruning (which removes other builds) need it exclusively. Only the
+        # first worker to miss downloads the build; the rest map the same files.
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_dir / ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            if index_path.exists() and metadata_path.exists():
+                print(f"Using cached RAG index for build {build_id}")
+            else:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # Another worker may have downloaded it while we waited
+                if not (index_path.exists() and metadata_path.exists()):
+                    build_dir.mkdir(parents=True, exist_ok=True)
+                    for object_name, path in (
+                        ("index.faiss", index_path),
+                        ("metadata.pkl", metadata_path),
+                    ):
+                        try:
+                            self._download_object(object_name, path)
+                            print(f"Downloaded {object_name} to cache")
+                        except Exception as e:
+                            raise ValueError(
+                                f"Could not download {object_name} from MinIO: "
+                                f"{e}. Run init job first to create the index."
+                            )
+                    self._prune_cache(keep=build_id)
 
-            # Download metadata to temp file
             try:
-                self.minio_client.fget_object(
-                    self.bucket_name, "metadata.pkl", str(metadata_path)
+                self._prefetch_file(index_path)
+                index = faiss.read_index(
+                    str(index_path), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
                 )
-                print("Downloaded metadata to temp file")
             except Exception as e:
-                raise ValueError(
-                    f"Could not download metadata.pkl from MinIO: {e}. "
-                    "Run init job first to create the index."
-                )
+                raise ValueError(f"Could not load FAISS index: {e}")
 
-            # Load metadata from file
             try:
                 with open(metadata_path, "rb") as f:
                     metadata = pickle.load(f)
             except Exception as e:
                 raise ValueError(f"Could not load metadata: {e}")
 
-            self.error_store = metadata["error_store"]
-            self.index_to_error_id = metadata["index_to_error_id"]
-
-            # Validate model name from metadata
-            if "model_name" in metadata:
-                model_name_meta = metadata["model_name"]
-                if model_name_meta != self.model_name:
-                    print(
-                        f"Warning: Model mismatch in metadata. "
-                        f"Metadata has {model_name_meta}, expected {self.model_name}"
-                    )
-
-            self._loaded = True
-
-            print("✓ RAG index loaded successfully")
-            print(f"  Total errors: {len(self.error_store)}")
-            print(f"  Model: {metadata.get('model_name', 'unknown')}")
-
-            return self.index, self.error_store, self.index_to_error_id
+        return index, metadata
 
+    def _download_object(self, object_name: str, path: Path):
+        """Download an object to path atomically (a partial file is never visible)."""
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        try:
+            self.minio_client.fget_object(self.bucket_name, object_name, str(tmp_path))
+            os.replace(tmp_path, path)
         finally:
-            # Cleanup temp directory
-            if temp_dir.exists():
-                shutil.rmtree(temp_dir, ignore_errors=True)
+            tmp_path.unlink(missing_ok=True)
+
+    def _prune_cache(self, keep: str):
+        """Remove cached artifacts of builds other than keep."""
+        for build_dir in self.cache_dir.iterdir():
+            if build_dir.is_dir() and build_dir.name != keep:
+                shutil.rmtree(build_dir, ignore_errors=True)
+
+    @staticmethod
+    def _prefetch_file(path: Path, chunk_size: int = 1 << 20):
+        """Read a file once so its pages are resident in the page cache."""
+        with open(path, "rb", buffering=0) as f:
+            while f.read(chunk_size):
+                pass
+
+    def _read_object(self, object_name: str) -> bytes:
+        """Read a whole object from the index bucket into memory."""
+        response = self.minio_client.get_object(self.bucket_name, object_name)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
 
     async def load_index(
         self,
-    ) -> Tuple[faiss.Index, Dict[str, Dict[str, Any]], Dict[int, str]]:
+    ) -> Tuple[faiss.Index, Dict[str, Dict[str, Any]], List[str]]:
         """
         Load FAISS index and metadata from MinIO.
 
-        Uses temp files for FAISS compatibility (FAISS prefers file paths).
-        Blocking I/O operations are run in a thread pool to avoid blocking the event loop.
+        Without a cache directory, artifacts are deserialized directly from the
+        downloaded bytes. With RAG_INDEX_CACHE_DIR set, they are read from the
+        per-build local cache (downloaded on a miss) and the FAISS index is
+        memory-mapped. Blocking I/O operations are run in a thread pool to
+        avoid blocking the event loop.
 
         Returns:
             Tuple of (FAISS index, error_store, index_to_error_id mapping)
@@ -227,12 +369,22 @@ class RAGIndexLoader:
             return self.index, self.error_store, self.index_to_error_id
 
         # Run blocking I/O operations in a thread pool to avoid blocking the event loop
-        return await asyncio.to_thread(self._load_index_sync)
+        state = await asyncio.to_thread(self._load_index_sync)
+
+        # Swap the new index in on the event loop (no await in between), so
+        # queries never see a mix of old and new attributes
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._loaded = True
+
+        return self.index, self.error_store, self.index_to_error_id
 
     async def reload_index(self):
-        """Force reload of index from MinIO."""
+        """
+        Force reload of index from MinIO.
+
+        The current index keeps serving queries until the new one has loaded,
+        and stays in place if the reload fails.
+        """
         self._loaded = False
-        self.index = None
-        self.error_store = {}
-        self.index_to_error_id = {}
         return await self.load_index()
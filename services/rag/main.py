@@ -4,15 +4,20 @@ RAG Service - FastAPI service for RAG queries.
 
 import os
 import json
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
+import faiss
 import numpy as np
-from fastapi import FastAPI, HTTPException
+import orjson
+from cachetools import TTLCache
+from fastapi import FastAPI, HTTPException, Response
 from pydantic import BaseModel, Field
 from index_loader import RAGIndexLoader
 import time
 import logging
+import threading
 import httpx
 import asyncio
+import base64
 
 # Configure logging
 logging.basicConfig(
@@ -31,11 +36,76 @@ index_loader: Optional[RAGIndexLoader] = None
 # Global HTTP client for embedding service (with connection pooling)
 embedding_client: Optional[httpx.AsyncClient] = None
 
+# In-process SentenceTransformer model (only when RAG_EMBEDDINGS_BACKEND=local)
+local_embedding_model = None
+LOCAL_EMBEDDINGS_RUNTIMES = ("torch", "onnx")
+
+# Normalized query embeddings keyed on query text (RAG_QUERY_CACHE_SIZE=0 disables)
+QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "10000"))
+QUERY_CACHE_TTL = int(os.getenv("RAG_QUERY_CACHE_TTL", "3600"))  # seconds
+query_embedding_cache: Optional[TTLCache] = (
+    TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+    if QUERY_CACHE_SIZE > 0
+    else None
+)
 
-class QueryRequest(BaseModel):
-    """Request model for RAG query."""
+# Set from the MinIO notification watcher when LATEST.json is (re)written
+index_changed: Optional[asyncio.Event] = None
+
+# Fallback poll interval when no notification arrives (seconds)
+INDEX_POLL_INTERVAL = 20
+
+# TEI rejects client batches above MAX_CLIENT_BATCH_SIZE (32); stay below it
+EMBEDDING_BATCH_SIZE = 30
+
+
+def available_cpus() -> int:
+    """
+    Number of CPUs this process can actually use.
+
+    os.cpu_count() reports every core of the node; inside a container the
+    usable share is bounded by the CPU affinity mask and the cgroup v2 CPU
+    quota (cpu.max), so take the smaller of the two.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def web_concurrency() -> int:
+    """Number of uvicorn workers (WEB_CONCURRENCY), at least 1."""
+    try:
+        return max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    except ValueError:
+        return 1
+
+
+# FAISS uses OpenMP inside search. Single queries run with one thread per
+# worker so concurrent requests don't oversubscribe the CPUs; scale out with
+# uvicorn workers (WEB_CONCURRENCY) instead. Batched queries get this
+# worker's share of the usable CPUs for the duration of their search.
+FAISS_OMP_THREADS = int(os.getenv("RAG_FAISS_OMP_THREADS", "1"))
+FAISS_BATCH_OMP_THREADS = int(
+    os.getenv(
+        "RAG_FAISS_BATCH_OMP_THREADS",
+        str(max(1, available_cpus() // web_concurrency())),
+    )
+)
+faiss.omp_set_num_threads(FAISS_OMP_THREADS)
+
+
+class QueryParameters(BaseModel):
+    """Search parameters shared by single and batched RAG queries."""
 
-    query: str = Field(description="Query text to search for")
     top_k: int = Field(
         default=10, ge=1, le=100, description="Number of top candidates to retrieve"
     )
@@ -47,6 +117,20 @@ class QueryRequest(BaseModel):
     )
 
 
+class QueryRequest(QueryParameters):
+    """Request model for RAG query."""
+
+    query: str = Field(description="Query text to search for")
+
+
+class QueryBatchRequest(QueryParameters):
+    """Request model for a batch of RAG queries sharing the same parameters."""
+
+    queries: List[str] = Field(
+        min_length=1, max_length=100, description="Query texts to search for"
+    )
+
+
 class ErrorSection(BaseModel):
     """Error section data."""
 
@@ -76,6 +160,35 @@ class QueryResponse(BaseModel):
     metadata: Dict[str, Any]
 
 
+class QueryBatchResponse(BaseModel):
+    """Response model for a batch of RAG queries (one response per query)."""
+
+    responses: List[QueryResponse]
+    metadata: Dict[str, Any]
+
+
+def load_local_embedding_model():
+    """
+    Load the embedding model in-process for RAG_EMBEDDINGS_BACKEND=local.
+
+    Requires the optional local-embeddings dependencies (sentence-transformers
+    3.2+). RAG_LOCAL_EMBEDDINGS_RUNTIME selects the inference runtime ("torch"
+    or "onnx"; onnx needs the local-embeddings-onnx extra).
+    """
+    runtime = os.getenv("RAG_LOCAL_EMBEDDINGS_RUNTIME", "torch").lower()
+    if runtime not in LOCAL_EMBEDDINGS_RUNTIMES:
+        raise ValueError(
+            f"Invalid RAG_LOCAL_EMBEDDINGS_RUNTIME: {runtime}. "
+            f"Must be one of {LOCAL_EMBEDDINGS_RUNTIMES}"
+        )
+
+    from sentence_transformers import SentenceTransformer
+
+    model_name = os.getenv("RAG_MODEL_NAME", "nomic-ai/nomic-embed-text-v1.5")
+    logger.info("Loading embedding model in-process: %s (%s)", model_name, runtime)
+    return SentenceTransformer(model_name, trust_remote_code=True, backend=runtime)
+
+
 async def load_index():
     """Load index from MinIO. Returns True if successful, False otherwise."""
     global index_loader
@@ -100,11 +213,49 @@ async def load_index():
         return False
 
 
+def watch_index_pointer(loop: asyncio.AbstractEventLoop, event: asyncio.Event):
+    """
+    Watch MinIO bucket notifications for writes to LATEST.json.
+
+    Runs in a daemon thread (the MinIO notification stream is blocking) and
+    wakes poll_for_index as soon as the init job publishes a new pointer,
+    instead of leaving it to the next poll interval. Reconnects after errors,
+    e.g. while the bucket does not exist yet.
+    """
+    while True:
+        try:
+            with index_loader.minio_client.listen_bucket_notification(
+                index_loader.bucket_name,
+                prefix="LATEST.json",
+                events=("s3:ObjectCreated:*",),
+            ) as events:
+                for _ in events:
+                    logger.info("RAG index pointer (LATEST.json) updated")
+                    loop.call_soon_threadsafe(event.set)
+        except Exception as e:
+            logger.debug("RAG index notification watch interrupted: %s", e)
+        time.sleep(INDEX_POLL_INTERVAL)
+
+
+async def wait_for_index_change(timeout: float):
+    """Sleep until LATEST.json changes or timeout elapses, whichever is first."""
+    try:
+        await asyncio.wait_for(index_changed.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    index_changed.clear()
+
+
 async def poll_for_index():
-    """Background task that polls for RAG index every 20 seconds."""
+    """
+    Background task that loads the RAG index once it becomes available.
+
+    Wakes on MinIO notifications for LATEST.json, falling back to polling
+    every INDEX_POLL_INTERVAL seconds.
+    """
     global index_loader
 
-    poll_interval = 20  # seconds
+    poll_interval = INDEX_POLL_INTERVAL
 
     while True:
         try:
@@ -119,10 +270,18 @@ async def poll_for_index():
                         response = index_loader.minio_client.get_object(
                             index_loader.bucket_name, "LATEST.json"
                         )
-                        pointer = json.loads(response.read().decode())
+                        try:
+                            pointer = json.loads(response.read().decode())
+                        finally:
+                            response.close()
+                            response.release_conn()
                         latest_build_id = pointer.get("build_id")
+                        # The init job writes LATEST.json with the new build_id
+                        # while still BUILDING; only switch once it is READY
+                        # (the current index keeps serving until then)
                         if (
-                            latest_build_id
+                            pointer.get("status") == "READY"
+                            and latest_build_id
                             and latest_build_id != index_loader.last_loaded_build_id
                         ):
                             logger.info("Detected new RAG index build_id; reloading...")
@@ -130,7 +289,7 @@ async def poll_for_index():
                     except Exception as e:
                         logger.warning("Failed to check latest RAG build_id: %s", e)
 
-                await asyncio.sleep(poll_interval)
+                await wait_for_index_change(poll_interval)
                 continue
 
             # Try to load the index
@@ -148,25 +307,49 @@ async def poll_for_index():
         except Exception as e:
             logger.error("Error during index polling: %s", e, exc_info=True)
 
-        # Wait before next poll
-        await asyncio.sleep(poll_interval)
+        # Wait for the next pointer update (or poll interval)
+        await wait_for_index_change(poll_interval)
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize service and start polling for index."""
-    global embedding_client
+async def warm_up_embeddings():
+    """
+    Prepare the query embedding path before the first request.
 
-    # Try to load index, but don't fail if it doesn't exist
-    index_loaded = await load_index()
-    if not index_loaded:
-        logger.info(
-            "RAG index not found at startup. Will poll for index in background..."
+    Loads the in-process model when RAG_EMBEDDINGS_BACKEND=local; otherwise
+    sends one small request to the embedding service so a pooled connection
+    is already open and the model is warm. A failed TEI warmup is only
+    logged, since the embedding service may still be starting.
+    """
+    global local_embedding_model
+
+    # Optionally run the query embedding model in-process instead of via TEI
+    if os.getenv("RAG_EMBEDDINGS_BACKEND", "tei").lower() == "local":
+        local_embedding_model = await asyncio.to_thread(load_local_embedding_model)
+        logger.info("Using in-process embedding model for queries")
+        return
+
+    try:
+        response = await embedding_client.post(
+            "/embeddings",
+            content=orjson.dumps(
+                {
+                    "input": ["search_query: warmup"],
+                    "model": "nomic-embed-text-v1.5",
+                    "encoding_format": "base64",
+                }
+            ),
+            headers={"Content-Type": "application/json"},
         )
+        response.raise_for_status()
+        logger.info("Embedding service warmed up")
+    except Exception as e:
+        logger.warning("Embedding service warmup failed: %s", e)
 
-    # Always start background polling task (it will sleep if index is already loaded)
-    asyncio.create_task(poll_for_index())
-    logger.info("Started background polling task for RAG index (every 20 seconds)")
+
+@app.on_event("startup")
+async def startup_event():
+    """Initialize service and start polling for index."""
+    global embedding_client, index_changed
 
     # Initialize persistent HTTP client for embedding service with connection pooling
     embedding_url = os.getenv("EMBEDDINGS_LLM_URL", "http://alm-embedding:8080")
@@ -181,6 +364,31 @@ async def startup_event():
     )
     logger.info("Initialized embedding service HTTP client with connection pooling")
 
+    # Try to load index (but don't fail if it doesn't exist) while the
+    # embedding path warms up; the two don't depend on each other
+    index_loaded, _ = await asyncio.gather(load_index(), warm_up_embeddings())
+    if not index_loaded:
+        logger.info(
+            "RAG index not found at startup. Will poll for index in background..."
+        )
+
+    # Watch for index pointer updates so the poller wakes up immediately
+    index_changed = asyncio.Event()
+    threading.Thread(
+        target=watch_index_pointer,
+        args=(asyncio.get_running_loop(), index_changed),
+        name="rag-index-watch",
+        daemon=True,
+    ).start()
+
+    # Always start background polling task (it will sleep if index is already loaded)
+    asyncio.create_task(poll_for_index())
+    logger.info(
+        "Started background polling task for RAG index "
+        "(on LATEST.json notifications, or every %d seconds)",
+        INDEX_POLL_INTERVAL,
+    )
+
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -212,6 +420,242 @@ def readiness_check():
     return {"status": "ready", "index_size": index_loader.index.ntotal}
 
 
+def get_search_params(top_k: int) -> Optional[faiss.SearchParameters]:
+    """
+    Build per-query FAISS search parameters for the loaded index.
+
+    HNSW indexes need efSearch >= top_k to return a full candidate list;
+    exact (flat) indexes take no parameters.
+    """
+    if isinstance(index_loader.index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=max(64, top_k * 4))
+    return None
+
+
+async def embed_queries(queries: List[str]) -> np.ndarray:
+    """
+    Generate normalized embeddings for a list of queries.
+
+    Embeddings are served from the query embedding cache when possible; only
+    distinct cache misses are embedded, using the in-process model when
+    RAG_EMBEDDINGS_BACKEND=local, otherwise the TEI embedding service.
+
+    Returns:
+        float32 array of shape (len(queries), embedding_dim)
+    """
+    embeddings = np.empty((len(queries), index_loader.embedding_dim), dtype=np.float32)
+
+    missing_rows: Dict[str, List[int]] = {}
+    for row, query in enumerate(queries):
+        cached = (
+            query_embedding_cache.get(query)
+            if query_embedding_cache is not None
+            else None
+        )
+        if cached is None:
+            missing_rows.setdefault(query, []).append(row)
+        else:
+            embeddings[row] = cached
+
+    if len(missing_rows) < len(queries):
+        logger.info(
+            "Query embedding cache: %d hit(s), %d distinct miss(es)",
+            len(queries) - sum(len(rows) for rows in missing_rows.values()),
+            len(missing_rows),
+        )
+
+    if missing_rows:
+        # Prepare query texts with task prefix (for nomic models)
+        query_texts = [f"search_query: {query}" for query in missing_rows]
+
+        if local_embedding_model is not None:
+            new_embeddings = await embed_locally(query_texts)
+        else:
+            new_embeddings = await embed_with_tei(query_texts)
+
+        # Normalize embeddings row-wise, in place (zero vectors are left as-is)
+        faiss.normalize_L2(new_embeddings)
+
+        for (query, rows), embedding in zip(missing_rows.items(), new_embeddings):
+            embeddings[rows] = embedding
+            if query_embedding_cache is not None:
+                # Copy the row so a cached entry doesn't keep the whole batch
+                # matrix alive after its siblings are evicted
+                query_embedding_cache[query] = embedding.copy()
+
+    logger.info("Generated embeddings: shape=%s", embeddings.shape)
+    return embeddings
+
+
+async def embed_locally(query_texts: List[str]) -> np.ndarray:
+    """
+    Embed query texts with the in-process SentenceTransformer model.
+
+    Encoding is CPU-bound, so it runs in a worker thread to keep the event
+    loop responsive.
+    """
+    logger.info("Embedding %d texts in-process", len(query_texts))
+    embeddings = await asyncio.to_thread(
+        local_embedding_model.encode,
+        query_texts,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        convert_to_numpy=True,
+    )
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+
+async def embed_with_tei(query_texts: List[str]) -> np.ndarray:
+    """
+    Embed query texts via the TEI embedding service.
+
+    All texts go to the embedding service in as few requests as possible
+    (chunks of EMBEDDING_BATCH_SIZE, within TEI's client batch limit).
+    """
+    if embedding_client is None:
+        raise HTTPException(
+            status_code=503, detail="Embedding service client not initialized"
+        )
+
+    num_texts = len(query_texts)
+    total_batches = (num_texts + EMBEDDING_BATCH_SIZE - 1) // EMBEDDING_BATCH_SIZE
+
+    logger.info("Calling TEI at: %s/embeddings", embedding_client.base_url)
+    logger.info("  Model: nomic-ai/nomic-embed-text-v1.5")
+    logger.info(
+        "  Total texts: %d (will be batched into chunks of %d)",
+        num_texts,
+        EMBEDDING_BATCH_SIZE,
+    )
+
+    embeddings = np.empty((num_texts, index_loader.embedding_dim), dtype=np.float32)
+    for i in range(0, num_texts, EMBEDDING_BATCH_SIZE):
+        batch = query_texts[i : i + EMBEDDING_BATCH_SIZE]
+        batch_num = (i // EMBEDDING_BATCH_SIZE) + 1
+        logger.info(
+            "  Processing batch %d/%d (%d texts)...",
+            batch_num,
+            total_batches,
+            len(batch),
+        )
+
+        # Call embedding service using persistent client; embeddings come
+        # back base64-encoded so they decode straight into float32 rows
+        embedding_response = await embedding_client.post(
+            "/embeddings",
+            content=orjson.dumps(
+                {
+                    "input": batch,
+                    "model": "nomic-embed-text-v1.5",
+                    "encoding_format": "base64",
+                }
+            ),
+            headers={"Content-Type": "application/json"},
+        )
+        embedding_response.raise_for_status()
+
+        # Extract embeddings
+        embedding_data = orjson.loads(embedding_response.content)
+        if "data" in embedding_data and len(embedding_data["data"]) > 0:
+            batch_embeddings = [item["embedding"] for item in embedding_data["data"]]
+        elif "embeddings" in embedding_data and len(embedding_data["embeddings"]) > 0:
+            batch_embeddings = embedding_data["embeddings"]
+        else:
+            raise ValueError("Unexpected embedding response format")
+
+        if len(batch_embeddings) != len(batch):
+            raise ValueError(
+                f"Embedding service returned {len(batch_embeddings)} embeddings "
+                f"for {len(batch)} texts"
+            )
+
+        for row, embedding in enumerate(batch_embeddings, start=i):
+            if isinstance(embedding, str):
+                embedding = np.frombuffer(base64.b64decode(embedding), dtype="<f4")
+            embeddings[row] = embedding
+
+        logger.info("  Batch %d completed (%d embeddings)", batch_num, len(batch))
+
+    logger.info("All batches completed (%d total embeddings)", num_texts)
+
+    return embeddings
+
+
+def build_results(
+    similarities: np.ndarray, indices: np.ndarray, params: QueryParameters
+) -> Tuple[List[Dict[str, Any]], int, int]:
+    """
+    Turn one row of FAISS search output into ranked error results.
+
+    Returns:
+        Tuple of (top-N results, number of candidates, number above threshold)
+    """
+    # FAISS returns -1 when not enough results; drop those and anything below
+    # the threshold in one vectorized pass
+    valid = indices != -1
+    mask = valid & (similarities >= params.similarity_threshold)
+    num_candidates = int(np.count_nonzero(valid))
+    num_filtered = int(np.count_nonzero(mask))
+
+    # FAISS output is sorted by similarity, so the top-N are the first hits
+    top_indices = indices[mask][: params.top_n].tolist()
+    top_similarities = similarities[mask][: params.top_n].tolist()
+
+    results = []
+    for idx, similarity in zip(top_indices, top_similarities):
+        # Result fields are parallel lists indexed by FAISS position
+        sections = index_loader.sections[idx]
+
+        # Plain dicts in the ErrorResult shape (serialized by json_response)
+        result = {
+            "error_id": index_loader.error_ids[idx],
+            "error_title": index_loader.error_titles[idx],
+            "similarity_score": similarity,
+            "source_file": index_loader.source_files[idx],
+            "page": index_loader.pages[idx],
+            "sections": {
+                "description": sections.get("description"),
+                "symptoms": sections.get("symptoms"),
+                "resolution": sections.get("resolution"),
+                "code": sections.get("code"),
+                "benefits": sections.get("benefits"),
+            },
+        }
+        results.append(result)
+
+    return results, num_candidates, num_filtered
+
+
+def build_query_metadata(
+    params: QueryParameters, num_returned: int, search_time_ms: float
+) -> Dict[str, Any]:
+    """Build the metadata block returned with query results."""
+    return {
+        "num_results": num_returned,
+        "search_time_ms": search_time_ms,
+        "top_k": params.top_k,
+        "top_n": params.top_n,
+        "similarity_threshold": params.similarity_threshold,
+    }
+
+
+def json_response(payload: Dict[str, Any]) -> Response:
+    """
+    Serialize a query response with orjson.
+
+    Returning a Response skips FastAPI's response_model validation; the
+    models are kept on the routes for the OpenAPI schema only.
+    """
+    return Response(content=orjson.dumps(payload), media_type="application/json")
+
+
+def ensure_index_loaded():
+    """Raise 503 if the RAG index is not loaded yet."""
+    if index_loader is None or index_loader.index is None:
+        raise HTTPException(
+            status_code=503, detail="RAG index not loaded. Service is not ready."
+        )
+
+
 @app.post("/rag/query", response_model=QueryResponse)
 async def query_rag(request: QueryRequest):
     """
@@ -222,10 +666,7 @@ async def query_rag(request: QueryRequest):
     2. Performs similarity search using FAISS
     3. Returns top-N most relevant errors
     """
-    if index_loader is None or index_loader.index is None:
-        raise HTTPException(
-            status_code=503, detail="RAG index not loaded. Service is not ready."
-        )
+    ensure_index_loaded()
 
     start_time = time.time()
 
@@ -246,126 +687,123 @@ async def query_rag(request: QueryRequest):
 
     try:
         # Step 1: Generate query embedding
-        # Use persistent HTTP client with connection pooling
-        if embedding_client is None:
-            raise HTTPException(
-                status_code=503, detail="Embedding service client not initialized"
-            )
+        query_vector = await embed_queries([request.query])
 
-        logger.info("Calling TEI at: %s/embeddings", embedding_client.base_url)
-        logger.info("  Model: nomic-ai/nomic-embed-text-v1.5")
-        logger.info("  Total texts: 1 (will be batched into chunks of 30)")
-
-        # Prepare query text with task prefix (for nomic models)
-        query_text = f"search_query: {request.query}"
-
-        logger.info("  Processing batch 1/1 (1 texts)...")
+        # Step 2: Similarity search in FAISS
+        logger.info("Performing FAISS similarity search...")
+        similarities, indices = index_loader.index.search(
+            query_vector, request.top_k, params=get_search_params(request.top_k)
+        )
 
-        # Call embedding service using persistent client
-        embedding_response = await embedding_client.post(
-            "/embeddings",
-            json={
-                "input": [query_text],
-                "model": "nomic-embed-text-v1.5",
-            },
+        # Step 3: Filter by threshold, take top-N
+        results, num_candidates, num_filtered = build_results(
+            similarities[0], indices[0], request
         )
-        embedding_response.raise_for_status()
+        num_returned = len(results)
 
-        logger.info("  Batch 1 completed (1 embeddings)")
-        logger.info("All batches completed (1 total embeddings)")
+        search_time_ms = (time.time() - start_time) * 1000
 
-        # Extract embedding
-        embedding_data = embedding_response.json()
-        if "data" in embedding_data and len(embedding_data["data"]) > 0:
-            query_embedding = np.array(
-                embedding_data["data"][0]["embedding"], dtype=np.float32
-            )
-        elif "embeddings" in embedding_data and len(embedding_data["embeddings"]) > 0:
-            query_embedding = np.array(
-                embedding_data["embeddings"][0], dtype=np.float32
-            )
-        else:
-            raise ValueError("Unexpected embedding response format")
+        # Log query completion
+        logger.info("Query complete in %.2fms", search_time_ms)
+        logger.info("  Retrieved: %d candidates", num_candidates)
+        logger.info("  Filtered: %d above threshold", num_filtered)
+        logger.info("  Returned: %d results", num_returned)
 
-        # Normalize embedding
-        norm = np.linalg.norm(query_embedding)
-        if norm > 0:
-            query_embedding = query_embedding / norm
+        return json_response(
+            {
+                "query": request.query,
+                "results": results,
+                "metadata": build_query_metadata(request, num_returned, search_time_ms),
+            }
+        )
 
-        logger.info("Generated embeddings: shape=(1, %d)", len(query_embedding))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error processing query: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
-        # Step 2: Similarity search in FAISS
-        logger.info("Performing FAISS similarity search...")
-        query_vector = query_embedding.reshape(1, -1)
-        similarities, indices = index_loader.index.search(query_vector, request.top_k)
 
-        # Flatten results
-        similarities = similarities[0]
-        indices = indices[0]
+@app.post("/rag/query_batch", response_model=QueryBatchResponse)
+async def query_rag_batch(request: QueryBatchRequest):
+    """
+    Query the RAG system with several queries at once.
 
-        # Count candidates (excluding -1 indices)
-        num_candidates = len([idx for idx in indices if idx != -1])
+    Embeds the queries together (one embedding-service request per
+    EMBEDDING_BATCH_SIZE distinct cache misses) and runs one FAISS search
+    over the whole query matrix, then returns one QueryResponse per query
+    (in request order).
+    """
+    ensure_index_loaded()
 
-        # Step 3: Filter by threshold and format results
-        results = []
-        for idx, similarity in zip(indices, similarities):
-            if idx == -1:  # FAISS returns -1 when not enough results
-                continue
+    start_time = time.time()
 
-            if similarity < request.similarity_threshold:
-                continue
+    logger.info("=" * 70)
+    logger.info("QUERYING RAG SYSTEM (BATCH)")
+    logger.info("=" * 70)
+    logger.info(
+        "Queries: %d, parameters: top_k=%d, top_n=%d, threshold=%.2f",
+        len(request.queries),
+        request.top_k,
+        request.top_n,
+        request.similarity_threshold,
+    )
 
-            error_id = index_loader.index_to_error_id[idx]
-            error_data = index_loader.error_store[error_id]
-
-            # Extract sections
-            sections = error_data.get("sections", {})
-            metadata = error_data.get("metadata", {})
-
-            result = ErrorResult(
-                error_id=error_id,
-                error_title=error_data.get("error_title", error_id),
-                similarity_score=float(similarity),
-                source_file=metadata.get("source_file"),
-                page=metadata.get("page"),
-                sections=ErrorSection(
-                    description=sections.get("description"),
-                    symptoms=sections.get("symptoms"),
-                    resolution=sections.get("resolution"),
-                    code=sections.get("code"),
-                    benefits=sections.get("benefits"),
-                ),
-            )
-            results.append(result)
+    try:
+        # Step 1: Generate embeddings for all queries
+        query_matrix = await embed_queries(request.queries)
 
-        # Step 4: Take top-N results
-        num_filtered = len(results)
-        results = results[: request.top_n]
-        num_returned = len(results)
+        # Step 2: One FAISS search for the whole batch
+        logger.info("Performing FAISS similarity search...")
+        faiss.omp_set_num_threads(FAISS_BATCH_OMP_THREADS)
+        try:
+            similarities, indices = index_loader.index.search(
+                query_matrix, request.top_k, params=get_search_params(request.top_k)
+            )
+        finally:
+            faiss.omp_set_num_threads(FAISS_OMP_THREADS)
 
         search_time_ms = (time.time() - start_time) * 1000
 
-        # Log query completion
-        logger.info("Query complete in %.2fms", search_time_ms)
-        logger.info("  Retrieved: %d candidates", num_candidates)
-        logger.info("  Filtered: %d above threshold", num_filtered)
-        logger.info("  Returned: %d results", num_returned)
+        # Step 3: Filter and rank per query
+        responses = []
+        for query, query_similarities, query_indices in zip(
+            request.queries, similarities, indices
+        ):
+            results, _, _ = build_results(query_similarities, query_indices, request)
+            responses.append(
+                {
+                    "query": query,
+                    "results": results,
+                    "metadata": build_query_metadata(
+                        request, len(results), search_time_ms
+                    ),
+                }
+            )
 
-        return QueryResponse(
-            query=request.query,
-            results=results,
-            metadata={
-                "num_results": num_returned,
-                "search_time_ms": search_time_ms,
-                "top_k": request.top_k,
-                "top_n": request.top_n,
-                "similarity_threshold": request.similarity_threshold,
-            },
+        logger.info(
+            "Batch query complete in %.2fms (%d queries)",
+            search_time_ms,
+            len(responses),
+        )
+
+        return json_response(
+            {
+                "responses": responses,
+                "metadata": {
+                    "num_queries": len(responses),
+                    "search_time_ms": search_time_ms,
+                },
+            }
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error("Error processing query: %s", e, exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+        logger.error("Error processing batch query: %s", e, exc_info=True)
+        raise HTTPException(
+            status_code=500, detail=f"Error processing batch query: {str(e)}"
+        )
 
 
 @app.post("/rag/reload")
@@ -7,7 +7,7 @@ Ansible Error RAG System - Embedding and Indexing Module
 This module implements:
 - Groups chunks by error_id
 - Creates composite embeddings (description + symptoms)
-- Builds FAISS index for similarity search
+- Builds FAISS index for similarity search (flat or HNSW, by corpus size)
 - Persists index and metadata to disk
 
 Uses TEI (text-embeddings-inference) service for embeddings.
@@ -77,6 +77,10 @@ class EmbeddingClient:
         else:
             self.embedding_dim = 768  # Default for nomic models
 
+        # One session for all batches so the TCP connection to TEI is kept
+        # alive and reused instead of being re-established per request
+        self.session = requests.Session()
+
         logger.debug("TEI client initialized")
         logger.debug("  Embedding dimension: %d", self.embedding_dim)
 
@@ -95,22 +99,20 @@ class EmbeddingClient:
             show_progress_bar: Unused (kept for API compatibility)
 
         Returns:
-            Numpy array of embeddings
+            Numpy float32 array of embeddings with shape (len(texts), embedding_dim)
         """
         embeddings = self._encode_tei_api(texts)
 
-        embeddings = np.array(embeddings)
-
         # Normalize if requested (TEI may normalize, but we handle it here for consistency)
         if normalize_embeddings:
             norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
             # Protect against division by zero - use np.maximum to ensure minimum norm of 1e-8
             # This prevents inf/nan values if TEI returns a zero vector (unlikely but possible)
-            embeddings = embeddings / np.maximum(norms, 1e-8)
+            embeddings /= np.maximum(norms, 1e-8)
 
         return embeddings
 
-    def _encode_tei_api(self, texts: List[str]) -> List[List[float]]:
+    def _encode_tei_api(self, texts: List[str]) -> np.ndarray:
         """
         Encode using text-embeddings-inference (OpenAI-compatible API).
 
@@ -121,6 +123,7 @@ class EmbeddingClient:
         Texts passed here may already have prefixes, so we don't add them again.
 
         Batches requests to respect TEI's MAX_CLIENT_BATCH_SIZE limit (default: 16).
+        Each batch is written in place into a preallocated float32 matrix.
         """
         headers = {
             "Content-Type": "application/json",
@@ -144,7 +147,7 @@ class EmbeddingClient:
             BATCH_SIZE,
         )
 
-        all_embeddings = []
+        all_embeddings = np.empty((len(texts), self.embedding_dim), dtype=np.float32)
 
         # Process texts in batches
         for i in range(0, len(texts), BATCH_SIZE):
@@ -165,7 +168,7 @@ class EmbeddingClient:
             }
 
             try:
-                response = requests.post(
+                response = self.session.post(
                     url, json=payload, headers=headers, timeout=120
                 )
 
@@ -185,7 +188,12 @@ class EmbeddingClient:
                 else:
                     raise ValueError(f"Unexpected TEI response format: {result.keys()}")
 
-                all_embeddings.extend(batch_embeddings)
+                if len(batch_embeddings) != len(batch):
+                    raise ValueError(
+                        f"TEI returned {len(batch_embeddings)} embeddings "
+                        f"for {len(batch)} texts"
+                    )
+                all_embeddings[i : i + len(batch)] = batch_embeddings
                 logger.debug(
                     "  Batch %d completed (%d embeddings)",
                     batch_num,
@@ -249,8 +257,7 @@ class AnsibleErrorEmbedder:
 
         self.index = None
         self.error_store = {}
-        self.index_to_error_id = {}
-        self._embeddings_array = None  # Store embeddings for PostgreSQL saving
+        self.index_to_error_id = []
 
         logger.debug("Embedder initialized")
         logger.debug("  Mode: TEI Service")
@@ -445,9 +452,6 @@ class AnsibleErrorEmbedder:
         logger.debug("STEP:CREATING FAISS INDEX")
         logger.debug("=" * 60)
 
-        # Store embeddings array for PostgreSQL saving
-        self._embeddings_array = embeddings.copy()
-
         # Verify embeddings are normalized
         norms = np.linalg.norm(embeddings, axis=1)
         logger.debug(
@@ -457,19 +461,65 @@ class AnsibleErrorEmbedder:
             norms.mean(),
         )
 
-        # Create FAISS index
-        logger.debug(
-            "Building FAISS IndexFlatIP with dimension %d...", self.embedding_dim
-        )
-        self.index = faiss.IndexFlatIP(self.embedding_dim)
+        # Create FAISS index: exact search for small corpora, HNSW graph
+        # (inner product on normalized vectors == cosine) for larger ones.
+        # With SQ8 quantization each dimension is stored as one byte instead
+        # of a float32, cutting vector memory and scan bandwidth by 4x.
+        index_config = config.index
+        quantize = index_config.quantization == "sq8"
+        if len(embeddings) < index_config.hnsw_min_vectors:
+            if quantize:
+                logger.debug(
+                    "Building FAISS IndexScalarQuantizer (SQ8) with dimension %d...",
+                    self.embedding_dim,
+                )
+                self.index = faiss.IndexScalarQuantizer(
+                    self.embedding_dim,
+                    faiss.ScalarQuantizer.QT_8bit,
+                    faiss.METRIC_INNER_PRODUCT,
+                )
+            else:
+                logger.debug(
+                    "Building FAISS IndexFlatIP with dimension %d...",
+                    self.embedding_dim,
+                )
+                self.index = faiss.IndexFlatIP(self.embedding_dim)
+        else:
+            logger.debug(
+                "Building FAISS %s with dimension %d (M=%d)...",
+                "IndexHNSWSQ (SQ8)" if quantize else "IndexHNSWFlat",
+                self.embedding_dim,
+                index_config.hnsw_m,
+            )
+            if quantize:
+                self.index = faiss.IndexHNSWSQ(
+                    self.embedding_dim,
+                    faiss.ScalarQuantizer.QT_8bit,
+                    index_config.hnsw_m,
+                    faiss.METRIC_INNER_PRODUCT,
+                )
+            else:
+                self.index = faiss.IndexHNSWFlat(
+                    self.embedding_dim,
+                    index_config.hnsw_m,
+                    faiss.METRIC_INNER_PRODUCT,
+                )
+            self.index.hnsw.efConstruction = index_config.hnsw_ef_construction
+            # Persisted with the index; used by callers that don't override it
+            self.index.hnsw.efSearch = index_config.hnsw_ef_search
+
+        # Scalar quantizers learn per-dimension value ranges before adding
+        if not self.index.is_trained:
+            self.index.train(embeddings)
 
         # Add vectors to index
         self.index.add(embeddings)
 
         logger.debug("Index created with %d vectors", self.index.ntotal)
 
-        # Create mapping from index position to error_id
-        self.index_to_error_id = {i: error_id for i, error_id in enumerate(error_ids)}
+        # Create mapping from index position to error_id (a list, since FAISS
+        # positions are contiguous 0..n-1)
+        self.index_to_error_id = list(error_ids)
 
         # Store only errors that have embeddings
         self.error_store = {error_id: error_store[error_id] for error_id in error_ids}
@@ -539,6 +589,11 @@ class AnsibleErrorEmbedder:
 
         self.error_store = metadata["error_store"]
         self.index_to_error_id = metadata["index_to_error_id"]
+        if isinstance(self.index_to_error_id, dict):
+            # Older metadata stores the mapping as a {position: error_id} dict
+            self.index_to_error_id = [
+                self.index_to_error_id[i] for i in range(len(self.index_to_error_id))
+            ]
 
         logger.debug("Metadata loaded: %d errors", len(self.error_store))
         logger.debug("  Model: %s", metadata["model_name"])
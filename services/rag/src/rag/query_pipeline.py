@@ -258,7 +258,7 @@ class AnsibleErrorQueryPipeline:
                 continue
 
             # Get error_id from index mapping
-            error_id = self.embedder.index_to_error_id[idx]
+            error_id = self.embedder.index_to_error_id[int(idx)]
             error_data = self.embedder.error_store[error_id]
 
             # Create ErrorResult
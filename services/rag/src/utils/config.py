@@ -77,16 +77,52 @@ class StorageConfig:
         )
 
 
+class IndexConfig:
+    """Configuration for the FAISS index built from the knowledge base."""
+
+    def __init__(self):
+        # Below this many vectors an exact IndexFlatIP scan is cheap enough;
+        # larger corpora get an HNSW graph for sublinear search
+        self.hnsw_min_vectors = int(os.getenv("RAG_HNSW_MIN_VECTORS", "5000"))
+        self.hnsw_m = int(os.getenv("RAG_HNSW_M", "32"))
+        self.hnsw_ef_construction = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "200"))
+        self.hnsw_ef_search = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+        # Vector storage: "none" keeps float32 vectors, "sq8" stores them
+        # as 8-bit scalar-quantized codes (4x smaller)
+        self.quantization = os.getenv("RAG_INDEX_QUANTIZATION", "none").lower()
+
+    def validate(self):
+        """Validate configuration."""
+        if self.quantization not in ("none", "sq8"):
+            raise ValueError(
+                f"Unsupported RAG_INDEX_QUANTIZATION: {self.quantization} "
+                "(expected 'none' or 'sq8')"
+            )
+
+    def __repr__(self):
+        return (
+            f"IndexConfig(\n"
+            f"  hnsw_min_vectors={self.hnsw_min_vectors}\n"
+            f"  hnsw_m={self.hnsw_m}\n"
+            f"  hnsw_ef_construction={self.hnsw_ef_construction}\n"
+            f"  hnsw_ef_search={self.hnsw_ef_search}\n"
+            f"  quantization={self.quantization}\n"
+            f")"
+        )
+
+
 class Config:
     """Main configuration object."""
 
     def __init__(self):
         self.embeddings = EmbeddingsConfig()
         self.storage = StorageConfig()
+        self.index = IndexConfig()
 
     def validate(self):
         """Validate all configuration."""
         self.embeddings.validate()
+        self.index.validate()
         self.storage.ensure_directories()
 
     def print_config(self):
@@ -99,6 +135,7 @@ class Config:
         logger.debug("=" * 70)
         logger.debug("%s", self.embeddings)
         logger.debug("%s", self.storage)
+        logger.debug("%s", self.index)
         logger.debug("=" * 70)
 
 
@@ -11,11 +11,21 @@ from alm.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
-# Create SQLModel engine
+# Create SQLModel engine with an explicitly sized connection pool so bursts of
+# short transactions reuse open connections instead of queueing on a small pool
 engine = create_async_engine(
     os.getenv("DATABASE_URL")
     .replace("+asyncpg", "")
-    .replace("postgresql", "postgresql+asyncpg")
+    .replace("postgresql", "postgresql+asyncpg"),
+    pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),  # seconds
+    pool_pre_ping=True,
+    connect_args={
+        "prepared_statement_cache_size": 500,
+        # JIT compilation only adds planning latency for these short queries
+        "server_settings": {"jit": "off"},
+    },
 )
 
 
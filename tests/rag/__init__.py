@@ -0,0 +1 @@
+"""Tests for the RAG service (services/rag)."""
@@ -0,0 +1,253 @@
+"""
+Tests for the RAG service index loader in services/rag/index_loader.py.
+
+Uses a stub MinIO client holding the LATEST.json pointer and the index
+artifacts in memory, so no MinIO server is needed.
+"""
+
+import asyncio
+import json
+import pickle
+import sys
+from pathlib import Path
+
+import faiss
+import numpy as np
+import pytest
+
+# Add services/rag to Python path so the service module can be imported
+rag_service_path = Path(__file__).parents[2] / "services" / "rag"
+sys.path.insert(0, str(rag_service_path))
+
+from index_loader import RAGIndexLoader  # noqa: E402
+
+EMBEDDING_DIM = 8
+
+
+# =============================================================================
+# Test Fixtures - Stub MinIO client and index artifacts
+# =============================================================================
+
+
+class StubResponse:
+    """Minimal urllib3-style response returned by StubMinio.get_object."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def read(self) -> bytes:
+        return self.data
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class StubMinio:
+    """In-memory stand-in for the MinIO client used by RAGIndexLoader."""
+
+    def __init__(self):
+        self.objects = {}
+        self.downloads = []
+
+    def bucket_exists(self, bucket_name):
+        return True
+
+    def get_object(self, bucket_name, object_name):
+        if object_name not in self.objects:
+            raise KeyError(object_name)
+        return StubResponse(self.objects[object_name])
+
+    def fget_object(self, bucket_name, object_name, file_path):
+        self.downloads.append(object_name)
+        Path(file_path).write_bytes(self.objects[object_name])
+
+    def publish(self, build_id, num_errors, status="READY", legacy_mapping=False):
+        """Publish artifacts for a build and point LATEST.json at it."""
+        if status == "READY":
+            error_ids = [f"{build_id}_err_{i}" for i in range(num_errors)]
+            index = faiss.IndexFlatIP(EMBEDDING_DIM)
+            index.add(np.random.rand(num_errors, EMBEDDING_DIM).astype(np.float32))
+            index_to_error_id = (
+                dict(enumerate(error_ids)) if legacy_mapping else list(error_ids)
+            )
+            self.objects["index.faiss"] = faiss.serialize_index(index).tobytes()
+            self.objects["metadata.pkl"] = pickle.dumps(
+                {
+                    "error_store": {
+                        error_id: {
+                            "error_id": error_id,
+                            "error_title": f"Title of {error_id}",
+                            "sections": {"description": "desc"},
+                            "metadata": {"source_file": "guide.pdf", "page": 3},
+                        }
+                        for error_id in error_ids
+                    },
+                    "index_to_error_id": index_to_error_id,
+                    "model_name": "nomic-ai/nomic-embed-text-v1.5",
+                }
+            )
+        self.objects["LATEST.json"] = json.dumps(
+            {"status": status, "build_id": build_id}
+        ).encode()
+
+
+@pytest.fixture
+def minio():
+    """Stub MinIO client with one READY build published."""
+    client = StubMinio()
+    client.publish("build-1", num_errors=5)
+    return client
+
+
+def make_loader(minio, cache_dir=None):
+    """Create a loader that talks to the stub MinIO client."""
+    loader = RAGIndexLoader(
+        minio_endpoint="minio",
+        minio_port="9000",
+        minio_access_key="access",
+        minio_secret_key="secret",
+        cache_dir=str(cache_dir) if cache_dir else None,
+    )
+    loader.minio_client = minio
+    return loader
+
+
+# =============================================================================
+# Reloading
+# =============================================================================
+
+
+class TestReloadIndex:
+    """Tests for reload_index - switching to a new build."""
+
+    def test_reload_switches_to_new_build(self, minio):
+        """GIVEN a loaded build and a newer READY build
+        WHEN reload_index is called
+        THEN the loader serves the new build."""
+        loader = make_loader(minio)
+        asyncio.run(loader.load_index())
+        minio.publish("build-2", num_errors=7)
+
+        asyncio.run(loader.reload_index())
+
+        assert loader.last_loaded_build_id == "build-2"
+        assert loader.index.ntotal == 7
+        assert loader.error_ids[0] == "build-2_err_0"
+
+    def test_failed_reload_keeps_current_index(self, minio):
+        """GIVEN a loaded build and a pointer to a build still BUILDING
+        WHEN reload_index is called
+        THEN it fails and the current index stays in place."""
+        loader = make_loader(minio)
+        asyncio.run(loader.load_index())
+        minio.publish("build-2", num_errors=0, status="BUILDING")
+
+        with pytest.raises(ValueError, match="not ready"):
+            asyncio.run(loader.reload_index())
+
+        assert loader.index is not None, "Index was dropped by a failed reload"
+        assert loader.index.ntotal == 5
+        assert loader.last_loaded_build_id == "build-1", (
+            "build_id of a build that was never loaded must not be recorded"
+        )
+        assert loader.error_ids[0] == "build-1_err_0"
+
+
+# =============================================================================
+# Local artifact cache (RAG_INDEX_CACHE_DIR)
+# =============================================================================
+
+
+class TestArtifactCache:
+    """Tests for the per-build local artifact cache."""
+
+    def test_cache_miss_downloads_and_hit_skips_download(self, minio, tmp_path):
+        """GIVEN an empty cache directory
+        WHEN one loader loads the index and another loads the same build
+        THEN only the first downloads the artifacts."""
+        first = make_loader(minio, cache_dir=tmp_path)
+        asyncio.run(first.load_index())
+
+        assert sorted(minio.downloads) == ["index.faiss", "metadata.pkl"]
+        assert (tmp_path / "build-1" / "index.faiss").exists()
+        assert (tmp_path / "build-1" / "metadata.pkl").exists()
+
+        minio.downloads.clear()
+        second = make_loader(minio, cache_dir=tmp_path)
+        asyncio.run(second.load_index())
+
+        assert minio.downloads == [], "Cached build should not be downloaded again"
+        assert second.index.ntotal == 5
+        assert second.error_ids == first.error_ids
+
+    def test_build_change_prunes_old_build(self, minio, tmp_path):
+        """GIVEN a cached build
+        WHEN a new build is published and loaded
+        THEN the old build directory is removed and the new one is cached."""
+        loader = make_loader(minio, cache_dir=tmp_path)
+        asyncio.run(loader.load_index())
+        minio.publish("build-2", num_errors=7)
+
+        asyncio.run(loader.reload_index())
+
+        build_dirs = sorted(p.name for p in tmp_path.iterdir() if p.is_dir())
+        assert build_dirs == ["build-2"], f"Unexpected cache contents: {build_dirs}"
+        assert loader.index.ntotal == 7
+
+    def test_failed_download_leaves_no_partial_file(self, minio, tmp_path):
+        """GIVEN a download that fails after writing part of the file
+        WHEN the index is loaded
+        THEN loading fails, no partial artifact is left in the cache, and the
+        next load downloads the build again."""
+        real_fget_object = minio.fget_object
+
+        def failing_fget_object(bucket_name, object_name, file_path):
+            Path(file_path).write_bytes(b"partial")
+            raise ConnectionError("connection reset")
+
+        minio.fget_object = failing_fget_object
+        loader = make_loader(minio, cache_dir=tmp_path)
+
+        with pytest.raises(ValueError, match="Could not download index.faiss"):
+            asyncio.run(loader.load_index())
+
+        leftovers = [p.name for p in (tmp_path / "build-1").iterdir()]
+        assert leftovers == [], f"Partial files left in cache: {leftovers}"
+        assert loader.index is None
+
+        minio.fget_object = real_fget_object
+        asyncio.run(loader.load_index())
+
+        assert sorted(minio.downloads) == ["index.faiss", "metadata.pkl"]
+        assert loader.index.ntotal == 5
+
+
+# =============================================================================
+# Metadata compatibility
+# =============================================================================
+
+
+class TestLegacyMetadata:
+    """Tests for loading metadata written by older index builds."""
+
+    @pytest.mark.parametrize("use_cache", [False, True], ids=["in-memory", "cached"])
+    def test_dict_mapping_is_converted_to_list(self, minio, tmp_path, use_cache):
+        """GIVEN metadata with a legacy {position: error_id} dict
+        WHEN the index is loaded
+        THEN index_to_error_id is a position-ordered list and the result
+        columns are built from it."""
+        minio.publish("build-legacy", num_errors=4, legacy_mapping=True)
+        loader = make_loader(minio, cache_dir=tmp_path if use_cache else None)
+
+        asyncio.run(loader.load_index())
+
+        expected = [f"build-legacy_err_{i}" for i in range(4)]
+        assert isinstance(loader.index_to_error_id, list)
+        assert loader.index_to_error_id == expected
+        assert loader.error_ids == expected
+        assert loader.error_titles[2] == "Title of build-legacy_err_2"
+        assert loader.source_files[2] == "guide.pdf"
+        assert loader.pages[2] == 3
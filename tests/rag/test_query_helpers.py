@@ -0,0 +1,382 @@
+"""
+Tests for the RAG service query helpers in services/rag/main.py.
+
+Covers result filtering (build_results), query embedding with the query
+embedding cache (embed_queries) and TEI response decoding (embed_with_tei),
+using a stub index loader, a stub embedder and a mock HTTP transport so no
+MinIO or TEI service is needed.
+"""
+
+import asyncio
+import base64
+import json
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import pytest
+
+# Add services/rag to Python path so the service module can be imported
+rag_service_path = Path(__file__).parents[2] / "services" / "rag"
+sys.path.insert(0, str(rag_service_path))
+
+import main as rag_main  # noqa: E402
+from cachetools import TTLCache  # noqa: E402
+
+EMBEDDING_DIM = 4
+
+
+# =============================================================================
+# Test Fixtures - Stub index loader and embedder
+# =============================================================================
+
+
+@pytest.fixture
+def stub_index_loader(monkeypatch):
+    """Index loader exposing five errors as per-position result columns."""
+    n = 5
+    loader = SimpleNamespace(
+        embedding_dim=EMBEDDING_DIM,
+        error_ids=[f"err_{i}" for i in range(n)],
+        error_titles=[f"Error {i}" for i in range(n)],
+        source_files=[f"doc_{i}.pdf" for i in range(n)],
+        pages=list(range(1, n + 1)),
+        sections=[
+            {"description": f"description {i}", "resolution": f"fix {i}"}
+            for i in range(n)
+        ],
+    )
+    monkeypatch.setattr(rag_main, "index_loader", loader)
+    return loader
+
+
+@pytest.fixture
+def stub_embedder(monkeypatch):
+    """
+    Replace the TEI call with a deterministic embedder that records the
+    texts of every call.
+    """
+    calls = []
+
+    async def fake_embed_with_tei(query_texts):
+        calls.append(list(query_texts))
+        # Distinct, non-normalized vectors derived from the text length
+        return np.array(
+            [[len(text), 1.0, 2.0, 3.0] for text in query_texts], dtype=np.float32
+        )
+
+    monkeypatch.setattr(rag_main, "embed_with_tei", fake_embed_with_tei)
+    monkeypatch.setattr(rag_main, "local_embedding_model", None)
+    return calls
+
+
+@pytest.fixture
+def query_cache(monkeypatch):
+    """Fresh query embedding cache for each test."""
+    cache = TTLCache(maxsize=100, ttl=3600)
+    monkeypatch.setattr(rag_main, "query_embedding_cache", cache)
+    return cache
+
+
+def search_row(pairs):
+    """Build one FAISS output row from (index, similarity) pairs."""
+    indices = np.array([idx for idx, _ in pairs], dtype=np.int64)
+    similarities = np.array([sim for _, sim in pairs], dtype=np.float32)
+    return similarities, indices
+
+
+# =============================================================================
+# build_results
+# =============================================================================
+
+
+class TestBuildResults:
+    """Tests for build_results - filters and ranks one row of FAISS output."""
+
+    def test_drops_missing_results(self, stub_index_loader):
+        """GIVEN a FAISS row padded with -1 indices
+        WHEN build_results is called
+        THEN the -1 entries are neither returned nor counted as candidates."""
+        similarities, indices = search_row(
+            [(2, 0.9), (0, 0.8), (-1, -3.4e38), (-1, -3.4e38)]
+        )
+        params = rag_main.QueryParameters(top_k=4, top_n=5, similarity_threshold=0.0)
+
+        results, num_candidates, num_filtered = rag_main.build_results(
+            similarities, indices, params
+        )
+
+        assert [r["error_id"] for r in results] == ["err_2", "err_0"]
+        assert num_candidates == 2, f"Expected 2 candidates, got {num_candidates}"
+        assert num_filtered == 2, f"Expected 2 filtered, got {num_filtered}"
+
+    def test_filters_below_threshold(self, stub_index_loader):
+        """GIVEN hits on both sides of the threshold
+        WHEN build_results is called
+        THEN only hits at or above the threshold are kept."""
+        similarities, indices = search_row([(1, 0.9), (3, 0.6), (4, 0.59), (0, 0.1)])
+        params = rag_main.QueryParameters(top_k=4, top_n=5, similarity_threshold=0.6)
+
+        results, num_candidates, num_filtered = rag_main.build_results(
+            similarities, indices, params
+        )
+
+        assert [r["error_id"] for r in results] == ["err_1", "err_3"], (
+            "Threshold is inclusive and excludes everything below it"
+        )
+        assert num_candidates == 4
+        assert num_filtered == 2
+
+    def test_cuts_to_top_n(self, stub_index_loader):
+        """GIVEN more hits above the threshold than top_n
+        WHEN build_results is called
+        THEN only the first top_n hits are returned, in FAISS order,
+        while num_filtered still counts all of them."""
+        similarities, indices = search_row([(4, 0.95), (2, 0.9), (1, 0.85), (0, 0.8)])
+        params = rag_main.QueryParameters(top_k=4, top_n=2, similarity_threshold=0.5)
+
+        results, num_candidates, num_filtered = rag_main.build_results(
+            similarities, indices, params
+        )
+
+        assert [r["error_id"] for r in results] == ["err_4", "err_2"]
+        assert num_candidates == 4
+        assert num_filtered == 4
+
+    def test_no_hits_returns_empty(self, stub_index_loader):
+        """GIVEN no hits above the threshold
+        WHEN build_results is called
+        THEN no results are returned."""
+        similarities, indices = search_row([(0, 0.3), (-1, -3.4e38)])
+        params = rag_main.QueryParameters(top_k=2, top_n=3, similarity_threshold=0.5)
+
+        results, num_candidates, num_filtered = rag_main.build_results(
+            similarities, indices, params
+        )
+
+        assert results == []
+        assert num_candidates == 1
+        assert num_filtered == 0
+
+    def test_result_matches_response_model(self, stub_index_loader):
+        """GIVEN a hit
+        WHEN build_results is called
+        THEN the result is a plain dict that validates as an ErrorResult."""
+        similarities, indices = search_row([(3, 0.75)])
+        params = rag_main.QueryParameters(top_k=1, top_n=1, similarity_threshold=0.5)
+
+        results, _, _ = rag_main.build_results(similarities, indices, params)
+        result = rag_main.ErrorResult.model_validate(results[0])
+
+        assert result.error_id == "err_3"
+        assert result.error_title == "Error 3"
+        assert result.similarity_score == pytest.approx(0.75)
+        assert isinstance(results[0]["similarity_score"], float)
+        assert result.source_file == "doc_3.pdf"
+        assert result.page == 4
+        assert result.sections.description == "description 3"
+        assert result.sections.symptoms is None
+
+
+# =============================================================================
+# embed_queries
+# =============================================================================
+
+
+class TestEmbedQueries:
+    """Tests for embed_queries - cache-aware, deduplicated query embedding."""
+
+    def test_deduplicates_queries_within_batch(
+        self, stub_index_loader, stub_embedder, query_cache
+    ):
+        """GIVEN a batch with repeated queries
+        WHEN embed_queries is called
+        THEN each distinct query is embedded once and every row is filled."""
+        queries = ["disk full", "timeout", "disk full"]
+
+        embeddings = asyncio.run(rag_main.embed_queries(queries))
+
+        assert stub_embedder == [
+            ["search_query: disk full", "search_query: timeout"]
+        ], f"Expected one call with distinct prefixed texts, got {stub_embedder}"
+        assert embeddings.shape == (3, EMBEDDING_DIM)
+        assert embeddings.dtype == np.float32
+        np.testing.assert_array_equal(embeddings[0], embeddings[2])
+        assert not np.array_equal(embeddings[0], embeddings[1])
+
+    def test_embeddings_are_normalized(
+        self, stub_index_loader, stub_embedder, query_cache
+    ):
+        """GIVEN non-normalized vectors from the embedder
+        WHEN embed_queries is called
+        THEN the returned rows have unit length."""
+        embeddings = asyncio.run(rag_main.embed_queries(["a", "bb"]))
+
+        np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1.0, rtol=1e-6)
+
+    def test_cache_hit_skips_embedder(
+        self, stub_index_loader, stub_embedder, query_cache
+    ):
+        """GIVEN a query that was embedded before
+        WHEN it is embedded again
+        THEN the cached vector is returned without calling the embedder."""
+        first = asyncio.run(rag_main.embed_queries(["timeout"]))
+        second = asyncio.run(rag_main.embed_queries(["timeout"]))
+
+        assert len(stub_embedder) == 1, "Second call should be served from cache"
+        np.testing.assert_array_equal(first, second)
+
+    def test_embeds_only_cache_misses(
+        self, stub_index_loader, stub_embedder, query_cache
+    ):
+        """GIVEN a batch mixing cached and new queries
+        WHEN embed_queries is called
+        THEN only the new queries are sent to the embedder and rows keep
+        request order."""
+        cached = asyncio.run(rag_main.embed_queries(["timeout"]))
+        stub_embedder.clear()
+
+        embeddings = asyncio.run(
+            rag_main.embed_queries(["disk full", "timeout", "oom", "disk full"])
+        )
+
+        assert stub_embedder == [["search_query: disk full", "search_query: oom"]]
+        np.testing.assert_array_equal(embeddings[1], cached[0])
+        np.testing.assert_array_equal(embeddings[0], embeddings[3])
+        assert set(query_cache) == {"timeout", "disk full", "oom"}
+
+    def test_cached_entries_do_not_share_batch_memory(
+        self, stub_index_loader, stub_embedder, query_cache
+    ):
+        """GIVEN a batch of misses
+        WHEN their embeddings are cached
+        THEN each entry owns its memory instead of viewing the batch matrix."""
+        asyncio.run(rag_main.embed_queries(["a", "bb", "ccc"]))
+
+        for query, embedding in query_cache.items():
+            assert embedding.base is None, f"Cached entry for {query!r} is a view"
+            assert embedding.shape == (EMBEDDING_DIM,)
+
+    def test_works_without_cache(self, stub_index_loader, stub_embedder, monkeypatch):
+        """GIVEN the query cache is disabled
+        WHEN the same query is embedded twice
+        THEN the embedder is called both times."""
+        monkeypatch.setattr(rag_main, "query_embedding_cache", None)
+
+        asyncio.run(rag_main.embed_queries(["timeout"]))
+        asyncio.run(rag_main.embed_queries(["timeout"]))
+
+        assert len(stub_embedder) == 2
+
+
+# =============================================================================
+# embed_with_tei
+# =============================================================================
+
+
+def tei_vector(text):
+    """Deterministic embedding the mock TEI service returns for a text."""
+    return np.array([len(text), 0.5, -1.25, 3.0e-8], dtype=np.float32)
+
+
+def tei_client(response_format, requests, drop_last=False):
+    """
+    Embedding client backed by a mock TEI /embeddings endpoint.
+
+    response_format selects the body shape: OpenAI-style "data" items with
+    base64 ("base64") or float-list ("float") embeddings, or the legacy
+    top-level "embeddings" list ("legacy").
+    """
+
+    def handler(request):
+        payload = json.loads(request.content)
+        requests.append(payload)
+        vectors = [tei_vector(text) for text in payload["input"]]
+        if drop_last:
+            vectors = vectors[:-1]
+
+        if response_format == "base64":
+            body = {
+                "data": [
+                    {"embedding": base64.b64encode(v.astype("<f4").tobytes()).decode()}
+                    for v in vectors
+                ]
+            }
+        elif response_format == "float":
+            body = {"data": [{"embedding": v.tolist()} for v in vectors]}
+        else:
+            body = {"embeddings": [v.tolist() for v in vectors]}
+        return httpx.Response(200, json=body)
+
+    return httpx.AsyncClient(
+        base_url="http://tei", transport=httpx.MockTransport(handler)
+    )
+
+
+async def embed_with_mock_tei(monkeypatch, client, texts):
+    """Run embed_with_tei against client and close it afterwards."""
+    monkeypatch.setattr(rag_main, "embedding_client", client)
+    try:
+        return await rag_main.embed_with_tei(texts)
+    finally:
+        await client.aclose()
+
+
+class TestEmbedWithTei:
+    """Tests for embed_with_tei - batching and decoding TEI responses."""
+
+    @pytest.mark.parametrize("response_format", ["base64", "float", "legacy"])
+    def test_response_formats_decode_to_same_rows(
+        self, stub_index_loader, monkeypatch, response_format
+    ):
+        """GIVEN a TEI response in any supported format
+        WHEN embed_with_tei is called
+        THEN every row holds the exact float32 vector for its text."""
+        texts = ["search_query: disk full", "search_query: oom"]
+        requests = []
+
+        embeddings = asyncio.run(
+            embed_with_mock_tei(
+                monkeypatch, tei_client(response_format, requests), texts
+            )
+        )
+
+        assert embeddings.dtype == np.float32
+        np.testing.assert_array_equal(
+            embeddings, np.stack([tei_vector(text) for text in texts])
+        )
+        assert requests[0]["encoding_format"] == "base64"
+        assert requests[0]["input"] == texts
+
+    def test_batches_requests_in_order(self, stub_index_loader, monkeypatch):
+        """GIVEN more texts than EMBEDDING_BATCH_SIZE
+        WHEN embed_with_tei is called
+        THEN they are sent in chunks and rows keep the input order."""
+        texts = [f"search_query: {'x' * i}" for i in range(35)]
+        requests = []
+
+        embeddings = asyncio.run(
+            embed_with_mock_tei(monkeypatch, tei_client("base64", requests), texts)
+        )
+
+        assert [len(r["input"]) for r in requests] == [
+            rag_main.EMBEDDING_BATCH_SIZE,
+            35 - rag_main.EMBEDDING_BATCH_SIZE,
+        ]
+        np.testing.assert_array_equal(
+            embeddings, np.stack([tei_vector(text) for text in texts])
+        )
+
+    @pytest.mark.parametrize("response_format", ["base64", "float", "legacy"])
+    def test_short_response_raises(
+        self, stub_index_loader, monkeypatch, response_format
+    ):
+        """GIVEN a TEI response with fewer embeddings than texts sent
+        WHEN embed_with_tei is called
+        THEN it raises instead of returning partially filled rows."""
+        client = tei_client(response_format, [], drop_last=True)
+
+        with pytest.raises(ValueError, match="returned 1 embeddings for 2 texts"):
+            asyncio.run(embed_with_mock_tei(monkeypatch, client, ["a", "b"]))